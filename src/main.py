@@ -1,12 +1,19 @@
 # Copyright (c) farm-ng, inc. Amiga Development Kit License, Version 0.1
 import argparse
 import asyncio
+import functools
 import json
+import logging
 import os
 import subprocess
 from typing import List
+from typing import Optional
+from typing import Set
 
 from utils.gnss_client import GnssMonitor
+from utils.json_io import dump_json
+from utils.json_io import dumps_json
+from utils.json_io import load_json
 
 # import internal libs
 
@@ -40,16 +47,32 @@ class BaseStationApp(App):
 
     def __init__(self) -> None:
         super().__init__()
+        self._logger = logging.getLogger("base-station-app")
         self.async_tasks: List[asyncio.Task] = []
+        # Short-lived tasks started from UI callbacks, see spawn()
+        self._ui_tasks: Set[asyncio.Task] = set()
         self.gnss_monitor = GnssMonitor()
         self.selected_location = None
         self.current_mode = "survey-in"  # Default mode
+        self._uid: Optional[str] = None
+        # Label templates for the live GNSS position
+        self._lat_fmt = "Latitude: {:.10f}".format
+        self._lon_fmt = "Longitude: {:.10f}".format
+        self._alt_fmt = "Altitude: {:.5f} m".format
+        # Known locations live next to this script
+        self._locations_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "utils", "known-locations.json"
+        )
+        self._loc_mtime = None
+        self._loc_load_error = None
+        self._loc_popup = None
+        self._loc_button_layout = None
+        self._loc_popup_dirty = True
         self.load_known_locations()
         # Load initial config
         self.initial_config = None
         try:
-            with open("/mnt/service_config/basestation.json", "r") as f:
-                self.initial_config = json.load(f)
+            self.initial_config = load_json("/mnt/service_config/basestation.json")
         except Exception as e:
             print(f"Error loading base station configuration: {e}")
 
@@ -67,34 +90,30 @@ class BaseStationApp(App):
 
     def apply_initial_config(self, config):
         """Apply initial configuration after UI is built."""
+        ids = self.root.ids
         # Set initial mode
         self.current_mode = "fixed" if config["USE_FIXED_MODE"] else "survey-in"
 
         # Update UI based on mode
         if config["USE_FIXED_MODE"]:
             coords = config["COORDINATES"]
-            self.root.ids.current_coordinates_column.opacity = 0.5
-            self.root.ids.fixed_coordinates_column.opacity = 1
-            self.root.ids.switch_to_fixed_mode.disabled = True
-            self.root.ids.switch_to_survey_mode.disabled = False
+            ids.current_coordinates_column.opacity = 0.5
+            ids.fixed_coordinates_column.opacity = 1
+            ids.switch_to_fixed_mode.disabled = True
+            ids.switch_to_survey_mode.disabled = False
 
             # Check if these coordinates match any known location
-            for loc in self.location_data:
-                if (
-                    abs(loc["latitude"] - coords["LATITUDE"]) < 1e-6
-                    and abs(loc["longitude"] - coords["LONGITUDE"]) < 1e-6
-                    and abs(loc["altitude"] - coords["ALTITUDE"]) < 0.1
-                ):
-                    self.selected_location = loc
-                    break
+            self.selected_location = self.find_location_by_coords(
+                coords["LATITUDE"], coords["LONGITUDE"], coords["ALTITUDE"]
+            )
 
             # Update UI with coordinates
             self.update_ui_with_config(coords)
         else:
-            self.root.ids.current_coordinates_column.opacity = 1
-            self.root.ids.fixed_coordinates_column.opacity = 0.5
-            self.root.ids.switch_to_fixed_mode.disabled = False
-            self.root.ids.switch_to_survey_mode.disabled = True
+            ids.current_coordinates_column.opacity = 1
+            ids.fixed_coordinates_column.opacity = 0.5
+            ids.switch_to_fixed_mode.disabled = False
+            ids.switch_to_survey_mode.disabled = True
 
     def update_ui_with_config(self, coords):
         """Update UI with loaded configuration."""
@@ -118,55 +137,145 @@ class BaseStationApp(App):
             self.root.ids.select_location_button.text = self.selected_location["name"]
 
     def load_known_locations(self):
-        """Load known locations from JSON file."""
+        """Load known locations from JSON file.
+
+        The parsed locations are kept in memory and only re-read when the file's mtime changes.
+        """
         try:
-            # Get the directory where the script is located
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            json_path = os.path.join(script_dir, "utils", "known-locations.json")
-
-            with open(json_path, "r") as f:
-                data = json.load(f)
-                self.known_locations = [loc["name"] for loc in data["locations"]]
-                # Store all location data for later use
-                self.location_data = data["locations"]
+            mtime = os.stat(self._locations_path).st_mtime_ns
+            if mtime == self._loc_mtime:
+                return
+
+            data = load_json(self._locations_path)
+            self._set_known_locations(data["locations"])
+            self._loc_mtime = mtime
+            self._loc_load_error = None
         except Exception as e:
             print(f"Error loading known locations: {e}")
-            print(f"Tried to load from: {json_path}")
-            self.known_locations = []
-            self.location_data = []
+            print(f"Tried to load from: {self._locations_path}")
+            self._set_known_locations([])
+            self._loc_mtime = None
+            self._loc_load_error = e
+
+    async def save_known_locations(self, locations):
+        """Write locations to the JSON file and make them the in-memory source of truth."""
+        # After a failed load the in-memory list is empty, never write it back
+        if self._loc_load_error is not None:
+            raise RuntimeError(
+                f"Known locations could not be loaded: {self._loc_load_error}"
+            )
+
+        await self.run_blocking(self._write_known_locations, locations)
+        self._set_known_locations(locations)
+        self._loc_mtime = os.stat(self._locations_path).st_mtime_ns
+
+    def _write_known_locations(self, locations):
+        """Serialize locations to the JSON file."""
+        dump_json({"locations": locations}, self._locations_path)
+
+    def _set_known_locations(self, locations):
+        """Store location data and rebuild the lookup tables derived from it."""
+        self.location_data = locations
+        self.known_locations = [loc["name"] for loc in locations]
+        # Build in reverse so the first of duplicate entries wins, like a linear scan
+        self._loc_by_name = {loc["name"]: loc for loc in reversed(locations)}
+        self._loc_by_coord = {
+            self._coord_key(loc["latitude"], loc["longitude"], loc["altitude"]): loc
+            for loc in reversed(locations)
+        }
+        self._loc_popup_dirty = True
+
+    def find_location_by_coords(self, latitude, longitude, altitude):
+        """Return the known location within 1e-6 deg and 0.1 m of the coordinates, if any.
+
+        The quantized index answers the common case in O(1). Values that are within tolerance but
+        round to different keys (e.g. altitudes 100.04 and 100.06) fall back to a linear scan.
+        """
+        loc = self._loc_by_coord.get(self._coord_key(latitude, longitude, altitude))
+        if loc is not None:
+            return loc
+
+        for loc in self.location_data:
+            if (
+                abs(loc["latitude"] - latitude) < 1e-6
+                and abs(loc["longitude"] - longitude) < 1e-6
+                and abs(loc["altitude"] - altitude) < 0.1
+            ):
+                return loc
+        return None
+
+    @staticmethod
+    def _coord_key(latitude, longitude, altitude):
+        """Quantize coordinates so that matching locations hash to the same key."""
+        return round(latitude, 6), round(longitude, 6), round(altitude, 1)
 
     def switch_to_survey_mode(self):
         """Switch to fixed mode."""
+        ids = self.root.ids
         self.current_mode = "survey-in"
 
         # Update button states
-        self.root.ids.switch_to_fixed_mode.disabled = False
-        self.root.ids.switch_to_survey_mode.disabled = True
-        self.root.ids.current_coordinates_column.opacity = 1
-        self.root.ids.fixed_coordinates_column.opacity = 0.5
+        ids.switch_to_fixed_mode.disabled = False
+        ids.switch_to_survey_mode.disabled = True
+        ids.current_coordinates_column.opacity = 1
+        ids.fixed_coordinates_column.opacity = 0.5
 
     def switch_to_fixed_mode(self):
         """Switch to fixed mode."""
+        ids = self.root.ids
         self.current_mode = "fixed"
         # Enable location selection
-        self.root.ids.select_location_button.disabled = False
+        ids.select_location_button.disabled = False
         # Update button states
-        self.root.ids.switch_to_fixed_mode.disabled = True
-        self.root.ids.switch_to_survey_mode.disabled = False
-        self.root.ids.current_coordinates_column.opacity = 0.5
-        self.root.ids.fixed_coordinates_column.opacity = 1
+        ids.switch_to_fixed_mode.disabled = True
+        ids.switch_to_survey_mode.disabled = False
+        ids.current_coordinates_column.opacity = 0.5
+        ids.fixed_coordinates_column.opacity = 1
 
     def on_mode_toggle(self, state):
         """Handle mode toggle state change."""
         self.current_mode = "fixed" if state == "down" else "survey-in"
 
     def show_location_selection(self):
-        """Show popup with location selection buttons."""
-        content = BoxLayout(orientation="vertical", spacing=10, padding=10)
+        """Show popup with location selection buttons.
 
-        scroll = ScrollView(size_hint=(1, 0.9))
-        button_layout = BoxLayout(orientation="vertical", size_hint_y=None, spacing=5)
-        button_layout.bind(minimum_height=button_layout.setter("height"))
+        The popup is built once and its buttons are only rebuilt after the known locations change.
+        """
+        # Pick up external edits to the file, otherwise this is a no-op
+        self.load_known_locations()
+
+        if self._loc_popup is None:
+            content = BoxLayout(orientation="vertical", spacing=10, padding=10)
+
+            scroll = ScrollView(size_hint=(1, 0.9))
+            button_layout = BoxLayout(
+                orientation="vertical", size_hint_y=None, spacing=5
+            )
+            button_layout.bind(minimum_height=button_layout.setter("height"))
+            scroll.add_widget(button_layout)
+            content.add_widget(scroll)
+
+            close_button = Button(text="Close", size_hint_y=0.1)
+            content.add_widget(close_button)
+
+            self._loc_popup = Popup(
+                title="Select Location",
+                content=content,
+                size_hint=(0.8, 0.8),
+                auto_dismiss=True,
+            )
+            self._loc_button_layout = button_layout
+            close_button.bind(on_release=self._loc_popup.dismiss)
+
+        if self._loc_popup_dirty:
+            self._populate_location_buttons()
+        self._loc_popup.open()
+
+    def _populate_location_buttons(self):
+        """Rebuild the buttons of the location selection popup."""
+        popup = self._loc_popup
+        button_layout = self._loc_button_layout
+        button_layout.clear_widgets()
 
         for loc_name in self.known_locations:
             # Create horizontal layout for each location
@@ -197,68 +306,33 @@ class BaseStationApp(App):
             # Add the horizontal layout to the scrolling layout
             button_layout.add_widget(loc_box)
 
-            # btn = Button(
-            #     text=loc_name,
-            #     size_hint_y=None,
-            #     height='48dp'
-            # )
-            # btn.bind(on_release=lambda x, ln=loc_name: self.on_location_selected(ln, popup))
-            # button_layout.add_widget(btn)
-
-        scroll.add_widget(button_layout)
-        content.add_widget(scroll)
-
-        close_button = Button(text="Close", size_hint_y=0.1)
-        content.add_widget(close_button)
-
-        popup = Popup(
-            title="Select Location",
-            content=content,
-            size_hint=(0.8, 0.8),
-            auto_dismiss=True,
-        )
-        close_button.bind(on_release=popup.dismiss)
-        popup.open()
+        self._loc_popup_dirty = False
 
     def on_location_selected(self, location_name, popup):
         """Handle location selection."""
-        try:
-            # Get the directory where the script is located
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            json_path = os.path.join(script_dir, "utils", "known-locations.json")
-
-            with open(json_path, "r") as f:
-                data = json.load(f)
-                for loc in data["locations"]:
-                    if loc["name"] == location_name:
-                        self.selected_location = loc
-                        # Update selected location labels
-                        self.root.ids.selected_name_label.text = (
-                            f"Selected Location: {loc['name']}"
-                        )
-                        self.root.ids.selected_latitude_label.text = (
-                            f"Latitude: {loc['latitude']:.10f}"
-                        )
-                        self.root.ids.selected_longitude_label.text = (
-                            f"Longitude: {loc['longitude']:.10f}"
-                        )
-                        self.root.ids.selected_altitude_label.text = (
-                            f"Altitude: {loc['altitude']:.2f} m"
-                        )
-                        break
-        except Exception as e:
-            print(f"Error loading location data: {e}")
-
         popup.dismiss()
 
+        loc = self._loc_by_name.get(location_name)
+        if not loc:
+            return
+
+        self.selected_location = loc
+        # Update selected location labels
+        self.root.ids.selected_name_label.text = f"Selected Location: {loc['name']}"
+        self.root.ids.selected_latitude_label.text = f"Latitude: {loc['latitude']:.10f}"
+        self.root.ids.selected_longitude_label.text = (
+            f"Longitude: {loc['longitude']:.10f}"
+        )
+        self.root.ids.selected_altitude_label.text = (
+            f"Altitude: {loc['altitude']:.2f} m"
+        )
+
     def on_save_new_location(self):
         """Save current location as a new known location."""
         # Create popup for name input
         content = BoxLayout(orientation="vertical", spacing=10, padding=10)
 
         # Add name input field
-        from kivy.uix.textinput import TextInput
-
         name_input = TextInput(multiline=False, size_hint_y=None, height="48dp")
 
         # Add buttons
@@ -282,7 +356,7 @@ class BaseStationApp(App):
             auto_dismiss=False,
         )
 
-        def save_location(instance):
+        async def save_location():
             name = name_input.text.strip()
             if not name:
                 return
@@ -303,23 +377,9 @@ class BaseStationApp(App):
                     "altitude": alt,
                 }
 
-                # Get the directory where the script is located
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                json_path = os.path.join(script_dir, "utils", "known-locations.json")
-
-                # Read existing data
-                with open(json_path, "r") as f:
-                    data = json.load(f)
-
-                # Append new location
-                data["locations"].append(new_location)
-
-                # Write back to file
-                with open(json_path, "w") as f:
-                    json.dump(data, f, indent=4)
-
-                # Update the app's location data
+                # Append new location and write back to file
                 self.load_known_locations()
+                await self.save_known_locations(self.location_data + [new_location])
 
                 popup.dismiss()
 
@@ -331,7 +391,7 @@ class BaseStationApp(App):
                 )
                 error_popup.open()
 
-        save_button.bind(on_release=save_location)
+        save_button.bind(on_release=lambda x: self.spawn(save_location()))
         cancel_button.bind(on_release=popup.dismiss)
 
         popup.open()
@@ -352,8 +412,14 @@ class BaseStationApp(App):
             with open("/mnt/service_config/basestation.json", "w") as f:
                 json.dump(config, f, indent=4)
 
-    def on_apply_location(self):
+    async def on_apply_location(self):
         """Apply current configuration to basestation and restart GNSS service."""
+        # Presses queued while an apply is still running are dropped
+        apply_button = self.root.ids.apply_button
+        if apply_button.disabled:
+            return
+        apply_button.disabled = True
+
         try:
             # Prepare configuration based on current mode
             if self.current_mode == "fixed":
@@ -381,25 +447,20 @@ class BaseStationApp(App):
                 }
 
             # Write configuration with sudo
-            config_str = json.dumps(config, indent=4)
-            subprocess.run(
-                [
-                    "sudo",
-                    "bash",
-                    "-c",
-                    f"echo '{config_str}' > /mnt/service_config/basestation.json",
-                ],
+            await self.run_blocking(
+                subprocess.run,
+                ["sudo", "tee", "/mnt/service_config/basestation.json"],
+                input=dumps_json(config),
+                stdout=subprocess.DEVNULL,
                 check=True,
             )
 
             # Restart GNSS service with sudo
-            uid_cmd = subprocess.run(
-                ["id", "-u", "adminfarmng"], capture_output=True, text=True, check=True
-            )
-            uid = uid_cmd.stdout.strip()
+            uid = await self.run_blocking(self.get_admin_uid)
 
             # Restart GNSS service with the correct command
-            subprocess.run(
+            await self.run_blocking(
+                subprocess.run,
                 [
                     "sudo",
                     "-u",
@@ -424,13 +485,37 @@ class BaseStationApp(App):
                 lambda dt: success_popup.dismiss(), 2
             )  # Auto-dismiss after 2 seconds
 
-        except subprocess.CalledProcessError as e:
+        except Exception as e:
             error_popup = Popup(
                 title="Error",
                 content=Label(text=f"Failed to apply configuration: {str(e)}"),
                 size_hint=(0.6, 0.4),
             )
             error_popup.open()
+        finally:
+            apply_button.disabled = False
+
+    def get_admin_uid(self) -> str:
+        """Return the uid of the adminfarmng user, looked up once and cached."""
+        if self._uid is None:
+            uid_cmd = subprocess.run(
+                ["id", "-u", "adminfarmng"], capture_output=True, text=True, check=True
+            )
+            self._uid = uid_cmd.stdout.strip()
+        return self._uid
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Schedule a coroutine from a UI callback and keep a reference until it is done."""
+        task = asyncio.ensure_future(coro)
+        self._ui_tasks.add(task)
+        task.add_done_callback(self._ui_tasks.discard)
+        return task
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking call in the default executor to keep the event loop responsive."""
+        return await asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(func, *args, **kwargs)
+        )
 
     def on_exit_btn(self) -> None:
         """Kills the running kivy application."""
@@ -467,27 +552,13 @@ class BaseStationApp(App):
             auto_dismiss=False,
         )
 
-        def do_delete(instance):
+        async def do_delete():
             try:
-                # Get the directory where the script is located
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                json_path = os.path.join(script_dir, "utils", "known-locations.json")
-
-                # Read current data
-                with open(json_path, "r") as f:
-                    data = json.load(f)
-
-                # Remove location
-                data["locations"] = [
-                    loc for loc in data["locations"] if loc["name"] != location_name
-                ]
-
-                # Write back to file
-                with open(json_path, "w") as f:
-                    json.dump(data, f, indent=4)
-
-                # Reload locations
+                # Remove location and write back to file
                 self.load_known_locations()
+                await self.save_known_locations(
+                    [loc for loc in self.location_data if loc["name"] != location_name]
+                )
 
                 # Close both popups
                 confirm_popup.dismiss()
@@ -509,49 +580,89 @@ class BaseStationApp(App):
                 )
                 error_popup.open()
 
-        confirm_btn.bind(on_release=do_delete)
+        confirm_btn.bind(on_release=lambda x: self.spawn(do_delete()))
         cancel_btn.bind(on_release=confirm_popup.dismiss)
 
         confirm_popup.open()
 
     async def app_func(self):
-        async def run_wrapper() -> None:
-            await self.async_run(async_lib="asyncio")
-            for task in self.async_tasks:
-                task.cancel()
-
         # Add GNSS monitoring task
         self.async_tasks.append(asyncio.ensure_future(self.update_gnss_status()))
 
-        return await asyncio.gather(run_wrapper(), *self.async_tasks)
+        try:
+            await self.async_run(async_lib="asyncio")
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self) -> None:
+        """Cancel background tasks, wait for them to unwind and release the GNSS socket."""
+        tasks = [*self.async_tasks, *self._ui_tasks]
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self._logger.error(f"Background task failed: {result!r}")
+        await self.gnss_monitor.cleanup()
 
     async def update_gnss_status(self) -> None:
         """Monitor GNSS status updates."""
         while self.root is None:
             await asyncio.sleep(1.0)
 
+        last_position = None
         while True:
+            # Suspends until the GNSS socket has data, no need to poll
             status = await self.gnss_monitor.update_status()
-            if status:
-                print(
-                    f"Position: {status.latitude:.10f}, {status.longitude:.10f}, {status.altitude:.5f}"
-                )
-                # Update Kivy UI with the new GNSS status
-                self.root.ids.latitude_label.text = f"Latitude: {status.latitude:.10f}"
-                self.root.ids.longitude_label.text = (
-                    f"Longitude: {status.longitude:.10f}"
-                )
-                self.root.ids.altitude_label.text = f"Altitude: {status.altitude:.5f} m"
-            await asyncio.sleep(1.0)
+            if not status:
+                # Not connected, back off before reconnecting
+                await asyncio.sleep(1.0)
+                continue
+
+            position = (status.latitude, status.longitude, status.altitude)
+            if position == last_position:
+                continue
+            last_position = position
+
+            self._logger.debug(
+                "Position: %.10f, %.10f, %.5f",
+                status.latitude,
+                status.longitude,
+                status.altitude,
+            )
+            # Update Kivy UI with the new GNSS status
+            self.root.ids.latitude_label.text = self._lat_fmt(status.latitude)
+            self.root.ids.longitude_label.text = self._lon_fmt(status.longitude)
+            self.root.ids.altitude_label.text = self._alt_fmt(status.altitude)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog="base-station-app")
+    parser.add_argument(
+        "--debug", action="store_true", help="Log every GNSS position update."
+    )
     args = parser.parse_args()
 
+    if args.debug:
+        # Without a handler debug records would only reach logging.lastResort (WARNING+)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+        logger = logging.getLogger("base-station-app")
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+
+    app = BaseStationApp()
     loop = asyncio.get_event_loop()
+    main_task = asyncio.ensure_future(app.app_func())
     try:
-        loop.run_until_complete(BaseStationApp().app_func())
+        loop.run_until_complete(main_task)
     except asyncio.CancelledError:
         pass
+    except KeyboardInterrupt:
+        # The interrupt can escape the loop while app_func is still suspended, so
+        # unwind it and release the socket before closing the loop
+        main_task.cancel()
+        loop.run_until_complete(asyncio.gather(main_task, return_exceptions=True))
+        loop.run_until_complete(app.shutdown())
     loop.close()
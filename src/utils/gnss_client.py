@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from io import BytesIO
 from typing import Optional
 
+from pyrtcm import ERR_RAISE
 from pyrtcm import RTCMReader
 
 
@@ -22,22 +23,30 @@ class BaseStationStatus:
     survey_in_duration: int = 0
 
 
+# WGS84 ellipsoid parameters
+_A = 6378137.0  # semi-major axis in meters
+_F = 1 / 298.257223563  # flattening
+_E2 = 2 * _F - _F * _F  # square of eccentricity
+_B = _A * (1 - _F)  # semi-minor axis in meters
+_EP2 = (_A * _A - _B * _B) / (_B * _B)  # square of second eccentricity
+
+
 def ecef_to_geodetic(x: float, y: float, z: float) -> tuple:
     """Convert ECEF coordinates to geodetic coordinates."""
-    a = 6378137.0  # semi-major axis in meters
-    f = 1 / 298.257223563  # flattening
-    e2 = 2 * f - f**2  # square of eccentricity
-
-    b = a * (1 - f)
-    ep2 = (a**2 - b**2) / b**2
-    p = math.sqrt(x**2 + y**2)
-    theta = math.atan2(z * a, p * b)
-    lon = math.atan2(y, x)
-    lat = math.atan2(
-        z + ep2 * b * math.sin(theta) ** 3, p - e2 * a * math.cos(theta) ** 3
+    sin, cos, atan2, sqrt = math.sin, math.cos, math.atan2, math.sqrt
+
+    p = sqrt(x * x + y * y)
+    theta = atan2(z * _A, p * _B)
+    sin_theta = sin(theta)
+    cos_theta = cos(theta)
+    lon = atan2(y, x)
+    lat = atan2(
+        z + _EP2 * _B * sin_theta * sin_theta * sin_theta,
+        p - _E2 * _A * cos_theta * cos_theta * cos_theta,
     )
-    N = a / math.sqrt(1 - e2 * math.sin(lat) ** 2)
-    height = p / math.cos(lat) - N
+    sin_lat = sin(lat)
+    N = _A / sqrt(1 - _E2 * sin_lat * sin_lat)
+    height = p / cos(lat) - N
 
     return math.degrees(lat), math.degrees(lon), height
 
@@ -52,6 +61,7 @@ class GnssMonitor:
         self.HOST = "localhost"
         self.PORT = 50010
         self._buffer = bytearray()
+        self._recv_buf = bytearray(16384)
 
     async def connect(self):
         """Establish connection to GNSS socket."""
@@ -73,41 +83,62 @@ class GnssMonitor:
 
         try:
             # Read data from socket
-            data = await asyncio.get_event_loop().sock_recv(self._socket, 1024)
-            if data:
-                # Append new data to buffer
-                self._buffer.extend(data)
-
-                # Process complete messages
-                while len(self._buffer) > 0:
-                    # Create RTCMReader for parsing
-                    stream = BytesIO(self._buffer)
-                    rtr = RTCMReader(stream)
-
-                    try:
-                        # Attempt to read a message
-                        raw_data, parsed_data = rtr.read()
-                        if parsed_data:
-                            if parsed_data.identity == "1005":
-                                # Process RTCM 1005 message
-                                lat, lon, height = ecef_to_geodetic(
-                                    parsed_data.DF025,
-                                    parsed_data.DF026,
-                                    parsed_data.DF027,
-                                )
-                                self.status.latitude = round(lat, 8)  # cm precision
-                                self.status.longitude = round(lon, 8)  # cm precision
-                                self.status.altitude = round(height, 2)  # cm precision
-
-                            # Remove processed message from buffer
-                            self._buffer = self._buffer[len(raw_data) :]
-                        else:
-                            # Not enough data for a complete message
-                            break
-                    except Exception as parse_error:
-                        # Remove first byte and try again
-                        self._buffer = self._buffer[1:]
-                        continue
+            n = await asyncio.get_event_loop().sock_recv_into(
+                self._socket, self._recv_buf
+            )
+            if not n:
+                # Peer closed the connection, reconnect on the next call
+                self._logger.warning("GNSS socket closed by peer")
+                await self.cleanup()
+                return None
+
+            # Append new data to buffer
+            self._buffer.extend(memoryview(self._recv_buf)[:n])
+
+            # Parse all complete messages from a single view of the buffer
+            stream = BytesIO(self._buffer)
+            # Raise on bad frames so the resync below decides what to skip
+            rtr = RTCMReader(stream, quitonerror=ERR_RAISE)
+            consumed = 0
+
+            while True:
+                # Skip any bytes before the next RTCM preamble
+                consumed = self._buffer.find(b"\xd3", consumed)
+                if consumed < 0:
+                    consumed = len(self._buffer)
+                    break
+                stream.seek(consumed)
+
+                try:
+                    # Attempt to read a message
+                    raw_data, parsed_data = rtr.read()
+                except Exception:
+                    if stream.tell() >= len(self._buffer):
+                        # Frame runs past the end of the buffer, wait for more data
+                        break
+                    # Not a valid frame, resync on the next preamble
+                    consumed += 1
+                    continue
+
+                if not parsed_data:
+                    # Reached the end of the buffer without a complete message
+                    break
+
+                if parsed_data.identity == "1005":
+                    # Process RTCM 1005 message
+                    lat, lon, height = ecef_to_geodetic(
+                        parsed_data.DF025,
+                        parsed_data.DF026,
+                        parsed_data.DF027,
+                    )
+                    self.status.latitude = round(lat, 8)  # cm precision
+                    self.status.longitude = round(lon, 8)  # cm precision
+                    self.status.altitude = round(height, 2)  # cm precision
+
+                consumed = stream.tell()
+
+            # Remove processed messages from buffer
+            del self._buffer[:consumed]
 
             return self.status
 
@@ -0,0 +1,29 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def load_json(path: str) -> Any:
+    """Parse a JSON file, using orjson when it is installed."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_json(obj: Any) -> bytes:
+    """Serialize an object to indented UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def dump_json(obj: Any, path: str) -> None:
+    """Write an object to a JSON file."""
+    with open(path, "wb") as f:
+        f.write(dumps_json(obj))
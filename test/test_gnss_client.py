@@ -0,0 +1,93 @@
+"""Tests for the RTCM parsing in the GNSS monitor."""
+import asyncio
+import socket
+
+import pytest
+from pyrtcm.rtcmhelpers import calc_crc24q
+from utils.gnss_client import ecef_to_geodetic
+from utils.gnss_client import GnssMonitor
+
+# ECEF position of the base station used in the tests
+X, Y, Z = -2707000.1234, -4263000.5, 3885000.25
+
+
+def rtcm_1005(x: float, y: float, z: float) -> bytes:
+    """Build an RTCM 1005 (stationary antenna reference point) frame."""
+    fields = [
+        (1005, 12),  # DF002 message number
+        (0, 12),  # DF003 reference station id
+        (0, 6),  # DF021 ITRF realization year
+        (1, 1),  # DF022 GPS indicator
+        (0, 1),  # DF023 GLONASS indicator
+        (0, 1),  # DF024 Galileo indicator
+        (0, 1),  # DF141 reference station indicator
+        (round(x * 1e4), 38),  # DF025 ECEF-X
+        (0, 1),  # DF142 single receiver oscillator indicator
+        (0, 1),  # DF001 reserved
+        (round(y * 1e4), 38),  # DF026 ECEF-Y
+        (0, 2),  # DF364 quarter cycle indicator
+        (round(z * 1e4), 38),  # DF027 ECEF-Z
+    ]
+    value = 0
+    nbits = 0
+    for field, bits in fields:
+        value = (value << bits) | (field & ((1 << bits) - 1))
+        nbits += bits
+    payload = value.to_bytes(nbits // 8, "big")
+    frame = b"\xd3" + len(payload).to_bytes(2, "big") + payload
+    return frame + calc_crc24q(frame).to_bytes(3, "big")
+
+
+class TestGnssMonitor:
+    """Feed raw bytes through a socket pair into GnssMonitor.update_status."""
+
+    @pytest.fixture
+    def sockets(self):
+        reader, writer = socket.socketpair()
+        reader.setblocking(False)
+        yield reader, writer
+        writer.close()
+        reader.close()
+
+    @pytest.fixture
+    def monitor(self, sockets) -> GnssMonitor:
+        monitor = GnssMonitor()
+        monitor._socket = sockets[0]
+        return monitor
+
+    @pytest.fixture
+    def writer(self, sockets) -> socket.socket:
+        return sockets[1]
+
+    @staticmethod
+    def feed(monitor: GnssMonitor, writer: socket.socket, data: bytes):
+        writer.sendall(data)
+        return asyncio.run(monitor.update_status())
+
+    @staticmethod
+    def assert_position(status) -> None:
+        lat, lon, height = ecef_to_geodetic(X, Y, Z)
+        assert status.latitude == pytest.approx(round(lat, 8))
+        assert status.longitude == pytest.approx(round(lon, 8))
+        assert status.altitude == pytest.approx(round(height, 2))
+
+    def test_garbage_before_frame(self, monitor, writer) -> None:
+        status = self.feed(monitor, writer, b"\x00\x01garbage" + rtcm_1005(X, Y, Z))
+        self.assert_position(status)
+        assert monitor._buffer == bytearray()
+
+    def test_fake_preamble(self, monitor, writer) -> None:
+        # A fake header claiming a long payload must not swallow the real frame
+        fake = b"\xd3\x00\x40" + b"\x00" * 4
+        status = self.feed(monitor, writer, fake + rtcm_1005(X, Y, Z) + b"\x00" * 64)
+        self.assert_position(status)
+
+    def test_frame_split_across_chunks(self, monitor, writer) -> None:
+        frame = rtcm_1005(X, Y, Z)
+        status = self.feed(monitor, writer, frame[:10])
+        assert status.latitude == 0.0
+        assert monitor._buffer == bytearray(frame[:10])
+
+        status = self.feed(monitor, writer, frame[10:])
+        self.assert_position(status)
+        assert monitor._buffer == bytearray()